@@ -1,6 +1,6 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
@@ -9,18 +9,31 @@ from pathlib import Path
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import aiosqlite
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 import bcrypt
-import jwt
+import hashlib
+import hmac
+import base64
+import functools
+import time
+from cachetools import TTLCache
 import google.generativeai as genai
 from docx import Document
 from docx.shared import Pt, RGBColor
-from pptx import Presentation
-from pptx.util import Inches, Pt as PptPt
-import tempfile
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml.etree import SubElement
+import io
+import re
+import zipfile
+from contextvars import ContextVar
+from urllib.parse import quote
 import json
+import orjson
+import zstandard as zstd
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -29,7 +42,27 @@ load_dotenv(ROOT_DIR / '.env')
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 hours (expires after work day)
+JWT_CACHE_TTL_SECONDS = 60
+OWNER_CACHE_TTL_SECONDS = 30
+FEEDBACK_FLUSH_INTERVAL_SECONDS = 0.5
+BCRYPT_ROUNDS = 10  # OWASP minimum; each +1 doubles hashing time
 DATABASE_PATH = ROOT_DIR / 'app.db'
+# Parsed once; the frontend authenticates with a Bearer header, so credentials
+# are only allowed for an explicit origin list, never for the '*' wildcard
+CORS_ORIGINS = tuple(
+    origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',') if origin.strip()
+) or ('*',)
+
+# Applied once when the shared connection is opened: WAL lets readers proceed
+# while a write is in flight and NORMAL sync skips the extra fsync per commit
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",  # ~64 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA foreign_keys=ON",
+)
 
 # Gemini API setup
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
@@ -40,10 +73,34 @@ else:
     print("❌ WARNING: GEMINI_API_KEY not found in environment variables")
     print("Please set GEMINI_API_KEY in your .env file")
 
+# Model handle is reused for every generation; the semaphore caps how many
+# requests are in flight at once so parallel section generation stays under
+# the API rate limit
+gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+GEMINI_MAX_CONCURRENCY = 8
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# All requests share one long-lived connection; write transactions take this
+# lock so one request's commit never flushes another's half-finished statements
+db_write_lock = asyncio.Lock()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
-    yield
+    app.state.db = await aiosqlite.connect(DATABASE_PATH)
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            await app.state.db.execute(pragma)
+        await init_db(app.state.db)
+        flusher = asyncio.create_task(feedback_flusher(app.state.db))
+        try:
+            yield
+        finally:
+            flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await flusher
+            await flush_feedback(app.state.db)
+    finally:
+        await app.state.db.close()
 
 app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
@@ -60,62 +117,135 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def init_db():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Users table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TEXT NOT NULL
-            )
-        """)
-        
-        # Projects table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS projects (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                topic TEXT NOT NULL,
-                config TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Sections table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS sections (
-                id TEXT PRIMARY KEY,
-                project_id TEXT NOT NULL,
-                section_order INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                content TEXT,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        """)
-        
-        # Refinements table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS refinements (
-                id TEXT PRIMARY KEY,
-                section_id TEXT NOT NULL,
-                prompt TEXT NOT NULL,
-                response TEXT NOT NULL,
-                feedback TEXT,
-                comment TEXT,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (section_id) REFERENCES sections (id)
-            )
-        """)
-        
+async def get_db(request: Request) -> aiosqlite.Connection:
+    """Shared database connection opened in lifespan"""
+    return request.app.state.db
+
+async def find_tables_without_cascade(db: aiosqlite.Connection) -> List[str]:
+    """Child tables created before ON DELETE CASCADE was declared.
+
+    SQLite cannot alter a foreign key in place, so init_db renames these,
+    recreates them with the current schema and copies their rows back.
+    """
+    legacy_tables = []
+    for table in ('sections', 'refinements'):
+        async with db.execute(f"PRAGMA foreign_key_list({table})") as cursor:
+            # Columns: id, seq, table, from, to, on_update, on_delete, match
+            foreign_keys = await cursor.fetchall()
+        if any(fk[6] != 'CASCADE' for fk in foreign_keys):
+            legacy_tables.append(table)
+    return legacy_tables
+
+async def init_db(db: aiosqlite.Connection):
+    legacy_tables = await find_tables_without_cascade(db)
+    if legacy_tables:
+        # Keys must not be checked while rows are moved, and the rename must not
+        # rewrite REFERENCES clauses in other tables to point at the old copy.
+        # Both pragmas are no-ops inside a transaction, so set them first
+        await db.execute("PRAGMA foreign_keys=OFF")
+        await db.execute("PRAGMA legacy_alter_table=ON")
+    
+    # sqlite3 autocommits DDL unless a transaction is open; run the whole
+    # schema setup in one so a failed migration leaves the old tables intact
+    await db.execute("BEGIN")
+    try:
+        await create_schema(db, legacy_tables)
         await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    finally:
+        if legacy_tables:
+            await db.execute("PRAGMA legacy_alter_table=OFF")
+            await db.execute("PRAGMA foreign_keys=ON")
+
+async def create_schema(db: aiosqlite.Connection, legacy_tables: List[str]):
+    for table in legacy_tables:
+        await db.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    
+    # Users table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    
+    # Projects table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS projects (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            config TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    
+    # Sections table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS sections (
+            id TEXT PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            section_order INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Refinements table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS refinements (
+            id TEXT PRIMARY KEY,
+            section_id TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            response TEXT NOT NULL,
+            feedback TEXT,
+            comment TEXT,
+            created_at TEXT NOT NULL,
+            response_zstd BLOB,
+            FOREIGN KEY (section_id) REFERENCES sections (id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Refined content is stored zstd-compressed; add the column to databases
+    # created before it existed (older rows keep their text in response)
+    async with db.execute("PRAGMA table_info(refinements)") as cursor:
+        refinement_columns = {row[1] for row in await cursor.fetchall()}
+    if 'response_zstd' not in refinement_columns:
+        await db.execute("ALTER TABLE refinements ADD COLUMN response_zstd BLOB")
+    
+    # Move rows from tables detached above into their recreated versions
+    for table in legacy_tables:
+        async with db.execute(f"PRAGMA table_info({table}_legacy)") as cursor:
+            columns = ', '.join(row[1] for row in await cursor.fetchall())
+        await db.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_legacy")
+        await db.execute(f"DROP TABLE {table}_legacy")
+
+    # Indexes for the per-user / per-project / per-section lookups
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_projects_user ON projects (user_id, created_at DESC)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sections_project ON sections (project_id, section_order)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_refinements_section ON refinements (section_id, created_at DESC)"
+    )
+    # Partial index matching the latest-feedback query
+    await db.execute(
+        """CREATE INDEX IF NOT EXISTS idx_refinements_section_feedback
+           ON refinements (section_id, created_at DESC) WHERE feedback IS NOT NULL"""
+    )
 
 class UserRegister(BaseModel):
     email: EmailStr
@@ -172,49 +302,248 @@ class AITemplateRequest(BaseModel):
     type: str  # 'docx' or 'pptx'
     topic: str
 
+# Response models for the remaining JSON endpoints. With a response model set,
+# FastAPI serializes straight to JSON bytes via pydantic-core instead of
+# jsonable_encoder + json.dumps
+class MessageResponse(BaseModel):
+    message: str
+
+class TokenValidationResponse(BaseModel):
+    valid: bool
+    user_id: str
+    email: str
+
+class GeneratedSection(BaseModel):
+    id: str
+    title: str
+    content: Optional[str]
+    order: int
+
+class GenerateContentResponse(BaseModel):
+    message: str
+    sections: List[GeneratedSection]
+
+class RefineContentResponse(BaseModel):
+    message: str
+    section_id: str
+    content: str
+
+class FeedbackStateResponse(BaseModel):
+    feedback: Optional[str]
+    comment: str
+    liked: bool
+    disliked: bool
+
+class CommentResponse(BaseModel):
+    comment: str
+    created_at: str
+
+class RevisionResponse(BaseModel):
+    prompt: str
+    response: str
+    created_at: str
+    timestamp: str
+
+class SectionOverviewResponse(BaseModel):
+    feedback: FeedbackStateResponse
+    comments: List[CommentResponse]
+    revisions: List[RevisionResponse]
+
+class AITemplateResponse(BaseModel):
+    type: str
+    topic: str
+    items: List[str]
+
+# SQL statements used by the endpoints. Defining each one once keeps the text
+# identical on every call, so sqlite3's prepared-statement cache is reused
+SQL_CHECK_PROJECT_OWNER = "SELECT id FROM projects WHERE id = ? AND user_id = ?"
+SQL_CHECK_SECTION_OWNER = """SELECT s.project_id FROM sections s
+                             JOIN projects p ON s.project_id = p.id
+                             WHERE s.id = ? AND p.user_id = ?"""
+SQL_INSERT_USER = "INSERT INTO users (id, email, password_hash, created_at) VALUES (?, ?, ?, ?)"
+SQL_GET_USER_BY_EMAIL = "SELECT id, email, password_hash FROM users WHERE email = ?"
+SQL_GET_USER_BY_ID = "SELECT id, email FROM users WHERE id = ?"
+SQL_INSERT_PROJECT = """INSERT INTO projects (id, user_id, name, type, topic, config, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+SQL_LIST_PROJECTS = "SELECT id, user_id, name, type, topic, config, created_at, updated_at FROM projects WHERE user_id = ? ORDER BY created_at DESC"
+SQL_GET_PROJECT = "SELECT id, user_id, name, type, topic, config, created_at, updated_at FROM projects WHERE id = ? AND user_id = ?"
+SQL_DELETE_PROJECT = "DELETE FROM projects WHERE id = ? AND user_id = ?"
+SQL_GET_PROJECT_WITH_SECTIONS = """SELECT p.id, p.type, p.topic, p.config, s.id, s.title, s.content, s.section_order
+                                   FROM projects p
+                                   LEFT JOIN sections s ON s.project_id = p.id
+                                   WHERE p.id = ? AND p.user_id = ?
+                                   ORDER BY s.section_order"""
+SQL_INSERT_SECTIONS = """INSERT INTO sections (id, project_id, section_order, title, content, created_at, updated_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)"""
+SQL_LIST_SECTIONS = """SELECT s.id, s.project_id, s.section_order, s.title, s.content, s.created_at, s.updated_at
+                       FROM sections s
+                       JOIN projects p ON p.id = s.project_id
+                       WHERE s.project_id = ? AND p.user_id = ?
+                       ORDER BY s.section_order"""
+SQL_GET_SECTION_FOR_REFINE = """SELECT s.id, s.content, s.title, p.user_id, p.topic
+                                FROM sections s
+                                JOIN projects p ON s.project_id = p.id
+                                WHERE s.id = ?"""
+SQL_UPDATE_SECTION_CONTENT = "UPDATE sections SET content = ?, updated_at = ? WHERE id = ?"
+SQL_INSERT_REFINEMENT = """INSERT INTO refinements (id, section_id, prompt, response, response_zstd, created_at)
+                           VALUES (?, ?, ?, '', ?, ?)"""
+SQL_UPDATE_LATEST_FEEDBACK = """UPDATE refinements SET feedback = ?, comment = ?
+                                WHERE id = (SELECT id FROM refinements WHERE section_id = ? ORDER BY created_at DESC LIMIT 1)"""
+SQL_INSERT_FIRST_FEEDBACK = """INSERT INTO refinements (id, section_id, prompt, response, feedback, comment, created_at)
+                               SELECT ?, s.id, 'Initial feedback', '', ?, ?, ? FROM sections s
+                               WHERE s.id = ? AND NOT EXISTS (SELECT 1 FROM refinements r WHERE r.section_id = s.id)"""
+SQL_GET_LATEST_FEEDBACK = "SELECT feedback, comment FROM refinements WHERE section_id = ? AND feedback IS NOT NULL ORDER BY created_at DESC LIMIT 1"
+SQL_LIST_COMMENTS = "SELECT comment, created_at FROM refinements WHERE section_id = ? AND comment IS NOT NULL AND comment != '' ORDER BY created_at DESC"
+SQL_LIST_REVISIONS = "SELECT prompt, response, response_zstd, created_at FROM refinements WHERE section_id = ? AND prompt != 'Initial feedback' ORDER BY created_at DESC"
+SQL_GET_SECTION_REFINEMENTS = """WITH owned AS (
+                                     SELECT s.id FROM sections s
+                                     JOIN projects p ON s.project_id = p.id
+                                     WHERE s.id = ? AND p.user_id = ?
+                                 )
+                                 SELECT o.id, r.prompt, r.response, r.response_zstd, r.feedback, r.comment, r.created_at
+                                 FROM owned o
+                                 LEFT JOIN refinements r ON r.section_id = o.id
+                                 ORDER BY r.created_at DESC"""
+SQL_GET_EXPORT_ROWS = """SELECT p.name, p.type, p.topic, s.title, s.content
+                         FROM projects p
+                         LEFT JOIN sections s ON s.project_id = p.id
+                         WHERE p.id = ? AND p.user_id = ?
+                         ORDER BY s.section_order"""
+
+# Refinement history stores the refined content zstd-compressed in
+# refinements.response_zstd rather than as plain text in response
+zstd_compressor = zstd.ZstdCompressor(level=3)
+zstd_decompressor = zstd.ZstdDecompressor()
+
 # Auth utilities
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+# Every token shares the same header, so its encoded form is computed once
+SECRET_KEY_BYTES = SECRET_KEY.encode('utf-8')
+JWT_HEADER_B64 = b64url_encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"}))
+
+def create_access_token(user_id: str) -> str:
+    """Issue an HS256 JWT carrying the user id (sub) and expiry (exp)"""
+    expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    signing_input = f"{JWT_HEADER_B64}.{b64url_encode(orjson.dumps({'sub': user_id, 'exp': expire}))}"
+    signature = hmac.new(SECRET_KEY_BYTES, signing_input.encode('ascii'), hashlib.sha256).digest()
+    return f"{signing_input}.{b64url_encode(signature)}"
+
+def decode_access_token(token: str) -> dict:
+    """Verify the HS256 signature of a token issued by create_access_token.
+
+    Returns the payload without checking its claims; raises ValueError for a
+    malformed token or a bad signature. The header is not parsed: only HS256
+    tokens are ever signed with SECRET_KEY and the signature covers it.
+    """
+    header_b64, payload_b64, signature_b64 = token.split('.')
+    expected = hmac.new(
+        SECRET_KEY_BYTES,
+        f"{header_b64}.{payload_b64}".encode('ascii'),
+        hashlib.sha256
+    ).digest()
+    if not hmac.compare_digest(expected, b64url_decode(signature_b64)):
+        raise ValueError("Signature verification failed")
+    payload = orjson.loads(b64url_decode(payload_b64))
+    if not isinstance(payload, dict):
+        raise ValueError("Payload is not a JSON object")
+    return payload
+
+# Successfully verified tokens -> (user_id, exp). Keyed by a digest so raw
+# tokens are never kept around; only valid tokens are ever cached.
+_jwt_cache = TTLCache(maxsize=10_000, ttl=JWT_CACHE_TTL_SECONDS)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    token = credentials.credentials
+    cache_key = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    cached = _jwt_cache.get(cache_key)
+    if cached is not None:
+        user_id, exp = cached
+        if exp > time.time():
+            return {"user_id": user_id}
+        _jwt_cache.pop(cache_key, None)
+    
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return {"user_id": user_id}
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+        payload = decode_access_token(token)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user_id = payload.get("sub")
+    exp = payload.get("exp")
+    if user_id is None or (exp is not None and not isinstance(exp, (int, float))):
         raise HTTPException(status_code=401, detail="Invalid token")
+    if exp is not None:
+        if exp <= time.time():
+            raise HTTPException(status_code=401, detail="Token expired")
+        # Never serve a cached entry past the token's own expiry
+        _jwt_cache[cache_key] = (user_id, exp)
+    return {"user_id": user_id}
+
+# Positive ownership checks only. Sections never move between projects, so a
+# section is cached as section_id -> project_id and its ownership falls back to
+# the project entry; deleting a project therefore only has to drop one key.
+_project_owner_cache = TTLCache(maxsize=50_000, ttl=OWNER_CACHE_TTL_SECONDS)
+_section_project_cache = TTLCache(maxsize=50_000, ttl=OWNER_CACHE_TTL_SECONDS)
+
+async def verify_project_owner(db: aiosqlite.Connection, user_id: str, project_id: str) -> None:
+    """Raise 404 unless the project exists and belongs to the user"""
+    if (user_id, project_id) in _project_owner_cache:
+        return
+    async with db.execute(
+        SQL_CHECK_PROJECT_OWNER,
+        (project_id, user_id)
+    ) as cursor:
+        if not await cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Project not found")
+    _project_owner_cache[(user_id, project_id)] = True
+
+async def verify_section_owner(db: aiosqlite.Connection, user_id: str, section_id: str) -> None:
+    """Raise 404 unless the section belongs to one of the user's projects"""
+    project_id = _section_project_cache.get(section_id)
+    if project_id is not None and (user_id, project_id) in _project_owner_cache:
+        return
+    async with db.execute(
+        SQL_CHECK_SECTION_OWNER,
+        (section_id, user_id)
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Section not found")
+    _section_project_cache[section_id] = row[0]
+    _project_owner_cache[(user_id, row[0])] = True
 
 @api_router.post("/auth/register", response_model=TokenResponse)
-async def register(user: UserRegister):
+async def register(user: UserRegister, db: aiosqlite.Connection = Depends(get_db)):
     user_id = str(uuid.uuid4())
-    password_hash = hash_password(user.password)
+    # bcrypt is CPU-bound; keep it off the event loop
+    password_hash = await asyncio.to_thread(hash_password, user.password)
     created_at = datetime.now(timezone.utc).isoformat()
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with db_write_lock:
         try:
             await db.execute(
-                "INSERT INTO users (id, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
+                SQL_INSERT_USER,
                 (user_id, user.email, password_hash, created_at)
             )
             await db.commit()
         except aiosqlite.IntegrityError:
+            await db.rollback()
             raise HTTPException(status_code=400, detail="Email already registered")
+        except Exception:
+            await db.rollback()
+            raise
     
-    access_token = create_access_token({"sub": user_id})
+    access_token = create_access_token(user_id)
     return TokenResponse(
         access_token=access_token,
         token_type="bearer",
@@ -223,56 +552,71 @@ async def register(user: UserRegister):
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(user: UserLogin):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute(
-            "SELECT id, email, password_hash FROM users WHERE email = ?",
-            (user.email,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if not row or not verify_password(user.password, row[2]):
-                raise HTTPException(status_code=401, detail="Invalid credentials")
-            
-            access_token = create_access_token({"sub": row[0]})
-            return TokenResponse(
-                access_token=access_token,
-                token_type="bearer",
-                user_id=row[0],
-                email=row[1]
-            )
+async def login(user: UserLogin, db: aiosqlite.Connection = Depends(get_db)):
+    async with db.execute(
+        SQL_GET_USER_BY_EMAIL,
+        (user.email,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row or not await asyncio.to_thread(verify_password, user.password, row[2]):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        
+        access_token = create_access_token(row[0])
+        return TokenResponse(
+            access_token=access_token,
+            token_type="bearer",
+            user_id=row[0],
+            email=row[1]
+        )
 
-@api_router.get("/auth/validate")
-async def validate_token(current_user: dict = Depends(get_current_user)):
+@api_router.get("/auth/validate", response_model=TokenValidationResponse)
+async def validate_token(current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     """Validate if the current token is still valid and return user info"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute(
-            "SELECT id, email FROM users WHERE id = ?",
-            (current_user['user_id'],)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=401, detail="User not found")
-            
-            return {
-                "valid": True,
-                "user_id": row[0],
-                "email": row[1]
-            }
+    async with db.execute(
+        SQL_GET_USER_BY_ID,
+        (current_user['user_id'],)
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=401, detail="User not found")
+        
+        return {
+            "valid": True,
+            "user_id": row[0],
+            "email": row[1]
+        }
+
+# Project configs are written with json.dumps, which keeps NaN/Infinity and
+# integers beyond 64 bits exactly; orjson would reject the integers and turn
+# NaN into null. Reads take the orjson fast path unless the text may contain
+# one of those values
+CONFIG_NEEDS_STDLIB_JSON = re.compile(r'\d{20}|NaN|Infinity')
+
+def load_config(text: str) -> Dict[str, Any]:
+    if CONFIG_NEEDS_STDLIB_JSON.search(text) is None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
 
 # Project endpoints
 @api_router.post("/projects", response_model=ProjectResponse)
-async def create_project(project: ProjectCreate, current_user: dict = Depends(get_current_user)):
+async def create_project(project: ProjectCreate, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     project_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
     
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute(
-            """INSERT INTO projects (id, user_id, name, type, topic, config, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (project_id, current_user['user_id'], project.name, project.type, 
-             project.topic, json.dumps(project.config), now, now)
-        )
-        await db.commit()
+    async with db_write_lock:
+        try:
+            await db.execute(
+                SQL_INSERT_PROJECT,
+                (project_id, current_user['user_id'], project.name, project.type, 
+                 project.topic, json.dumps(project.config), now, now)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
     
     return ProjectResponse(
         id=project_id,
@@ -286,231 +630,213 @@ async def create_project(project: ProjectCreate, current_user: dict = Depends(ge
     )
 
 @api_router.get("/projects", response_model=List[ProjectResponse])
-async def get_projects(current_user: dict = Depends(get_current_user)):
+async def get_projects(current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     projects = []
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute(
-            "SELECT id, user_id, name, type, topic, config, created_at, updated_at FROM projects WHERE user_id = ? ORDER BY created_at DESC",
-            (current_user['user_id'],)
-        ) as cursor:
-            async for row in cursor:
-                projects.append(ProjectResponse(
-                    id=row[0],
-                    user_id=row[1],
-                    name=row[2],
-                    type=row[3],
-                    topic=row[4],
-                    config=json.loads(row[5]),
-                    created_at=row[6],
-                    updated_at=row[7]
-                ))
-    return projects
-
-@api_router.get("/projects/{project_id}", response_model=ProjectResponse)
-async def get_project(project_id: str, current_user: dict = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute(
-            "SELECT id, user_id, name, type, topic, config, created_at, updated_at FROM projects WHERE id = ? AND user_id = ?",
-            (project_id, current_user['user_id'])
-        ) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="Project not found")
-            return ProjectResponse(
+    async with db.execute(
+        SQL_LIST_PROJECTS,
+        (current_user['user_id'],)
+    ) as cursor:
+        async for row in cursor:
+            projects.append(ProjectResponse(
                 id=row[0],
                 user_id=row[1],
                 name=row[2],
                 type=row[3],
                 topic=row[4],
-                config=json.loads(row[5]),
+                config=load_config(row[5]),
                 created_at=row[6],
                 updated_at=row[7]
-            )
+            ))
+    return projects
 
-@api_router.delete("/projects/{project_id}")
-async def delete_project(project_id: str, current_user: dict = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify project ownership
-        async with db.execute(
-            "SELECT id FROM projects WHERE id = ? AND user_id = ?",
-            (project_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Delete refinements first (foreign key constraint)
-        await db.execute("""
-            DELETE FROM refinements 
-            WHERE section_id IN (
-                SELECT id FROM sections WHERE project_id = ?
+@api_router.get("/projects/{project_id}", response_model=ProjectResponse)
+async def get_project(project_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    async with db.execute(
+        SQL_GET_PROJECT,
+        (project_id, current_user['user_id'])
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Project not found")
+        return ProjectResponse(
+            id=row[0],
+            user_id=row[1],
+            name=row[2],
+            type=row[3],
+            topic=row[4],
+            config=load_config(row[5]),
+            created_at=row[6],
+            updated_at=row[7]
+        )
+
+@api_router.delete("/projects/{project_id}", response_model=MessageResponse)
+async def delete_project(project_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    # Sections and their refinements are removed by ON DELETE CASCADE
+    async with db_write_lock:
+        try:
+            cursor = await db.execute(
+                SQL_DELETE_PROJECT,
+                (project_id, current_user['user_id'])
             )
-        """, (project_id,))
-        
-        # Delete sections
-        await db.execute("DELETE FROM sections WHERE project_id = ?", (project_id,))
-        
-        # Delete project
-        await db.execute("DELETE FROM projects WHERE id = ?", (project_id,))
-        
-        await db.commit()
-        return {"message": "Project deleted successfully"}
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    _project_owner_cache.pop((current_user['user_id'], project_id), None)
+    return {"message": "Project deleted successfully"}
 
 async def generate_with_gemini(prompt: str) -> str:
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        async with gemini_semaphore:
+            response = await gemini_model.generate_content_async(prompt)
         return response.text
     except Exception as e:
         logger.error(f"Gemini API error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
 
-@api_router.post("/generate-content")
-async def generate_content(request: GenerateContentRequest, current_user: dict = Depends(get_current_user)):
-    # Get project
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute(
-            "SELECT id, type, topic, config FROM projects WHERE id = ? AND user_id = ?",
-            (request.project_id, current_user['user_id'])
-        ) as cursor:
-            project_row = await cursor.fetchone()
-            if not project_row:
-                raise HTTPException(status_code=404, detail="Project not found")
-        
-        project_id, doc_type, topic, config_str = project_row
-        config = json.loads(config_str)
-        
-        # Check if content already generated or is being generated
-        async with db.execute(
-            "SELECT COUNT(*) FROM sections WHERE project_id = ?",
-            (project_id,)
-        ) as cursor:
-            count = await cursor.fetchone()
-            if count[0] > 0:
-                # Content already exists, return existing content
-                sections = []
-                async with db.execute(
-                    "SELECT id, title, content, section_order FROM sections WHERE project_id = ? ORDER BY section_order",
-                    (project_id,)
-                ) as cursor:
-                    async for row in cursor:
-                        sections.append({
-                            'id': row[0],
-                            'title': row[1], 
-                            'content': row[2],
-                            'order': row[3]
-                        })
-                return {"message": "Content already generated", "sections": sections}
-        
-        # Generate content for each section
-        sections = []
-        now = datetime.now(timezone.utc).isoformat()
-        
-        if doc_type == 'docx':
-            outline = config.get('outline', [])
-            for i, section_title in enumerate(outline):
-                section_id = str(uuid.uuid4())
-                prompt = f"""Write detailed, professional content for a document section.
+@api_router.post("/generate-content", response_model=GenerateContentResponse)
+async def generate_content(request: GenerateContentRequest, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    # Get project together with any existing sections (one row with NULL
+    # section columns when nothing has been generated yet)
+    async with db.execute(
+        SQL_GET_PROJECT_WITH_SECTIONS,
+        (request.project_id, current_user['user_id'])
+    ) as cursor:
+        rows = await cursor.fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    project_id, doc_type, topic, config_str = rows[0][:4]
+    config = load_config(config_str)
+    
+    # Check if content already generated or is being generated
+    if rows[0][4] is not None:
+        # Content already exists, return existing content
+        sections = [
+            {
+                'id': row[4],
+                'title': row[5], 
+                'content': row[6],
+                'order': row[7]
+            } for row in rows
+        ]
+        return {"message": "Content already generated", "sections": sections}
+    
+    # Build one prompt per section, then generate them all concurrently
+    titles = []
+    prompts = []
+    
+    if doc_type == 'docx':
+        outline = config.get('outline', [])
+        for i, section_title in enumerate(outline):
+            titles.append(section_title)
+            prompts.append(f"""Write detailed, professional content for a document section.
 
 Document Topic: {topic}
 Section Title: {section_title}
 Section Number: {i+1} of {len(outline)}
 
-Provide comprehensive content (300-500 words) for this section. Focus on being informative, well-structured, and professional. Do not include the section title in your response."""
-                
-                content = await generate_with_gemini(prompt)
-                
-                await db.execute(
-                    """INSERT INTO sections (id, project_id, section_order, title, content, created_at, updated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (section_id, project_id, i, section_title, content, now, now)
-                )
-                sections.append({
-                    'id': section_id,
-                    'title': section_title,
-                    'content': content,
-                    'order': i
-                })
-        
-        elif doc_type == 'pptx':
-            slides = config.get('slides', [])
-            for i, slide_title in enumerate(slides):
-                section_id = str(uuid.uuid4())
-                prompt = f"""Create content for a PowerPoint slide.
+Provide comprehensive content (300-500 words) for this section. Focus on being informative, well-structured, and professional. Do not include the section title in your response.""")
+    
+    elif doc_type == 'pptx':
+        slides = config.get('slides', [])
+        for i, slide_title in enumerate(slides):
+            titles.append(slide_title)
+            prompts.append(f"""Create content for a PowerPoint slide.
 
 Presentation Topic: {topic}
 Slide Title: {slide_title}
 Slide Number: {i+1} of {len(slides)}
 
-Provide 3-5 concise bullet points for this slide. Each point should be clear and impactful. Format as a simple bulleted list. Do not include the slide title."""
-                
-                content = await generate_with_gemini(prompt)
-                
-                await db.execute(
-                    """INSERT INTO sections (id, project_id, section_order, title, content, created_at, updated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (section_id, project_id, i, slide_title, content, now, now)
-                )
-                sections.append({
-                    'id': section_id,
-                    'title': slide_title,
-                    'content': content,
-                    'order': i
-                })
-        
-        await db.commit()
-        logger.info(f"Successfully generated {len(sections)} sections for project {project_id}")
-        return {"message": "Content generated successfully", "sections": sections}
+Provide 3-5 concise bullet points for this slide. Each point should be clear and impactful. Format as a simple bulleted list. Do not include the slide title.""")
+    
+    tasks = [asyncio.create_task(generate_with_gemini(prompt)) for prompt in prompts]
+    try:
+        contents = await asyncio.gather(*tasks)
+    except BaseException:
+        # gather leaves the other calls running when one fails; stop them so
+        # a failed request does not keep spending Gemini quota
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    now = datetime.now(timezone.utc).isoformat()
+    sections = [
+        {
+            'id': str(uuid.uuid4()),
+            'title': title,
+            'content': content,
+            'order': i
+        } for i, (title, content) in enumerate(zip(titles, contents))
+    ]
+    
+    rows = [
+        (section['id'], project_id, section['order'], section['title'], section['content'], now, now)
+        for section in sections
+    ]
+    
+    # Write everything once generation is done so the write lock is never
+    # held across Gemini calls; BEGIN IMMEDIATE takes SQLite's write lock once
+    # for the whole batch
+    async with db_write_lock:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await db.executemany(
+                SQL_INSERT_SECTIONS,
+                rows
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    logger.info(f"Successfully generated {len(sections)} sections for project {project_id}")
+    return {"message": "Content generated successfully", "sections": sections}
 
 @api_router.get("/projects/{project_id}/sections", response_model=List[SectionResponse])
-async def get_sections(project_id: str, current_user: dict = Depends(get_current_user)):
+async def get_sections(project_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     sections = []
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify project ownership
-        async with db.execute(
-            "SELECT id FROM projects WHERE id = ? AND user_id = ?",
-            (project_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Project not found")
-        
-        # Get sections
-        async with db.execute(
-            "SELECT id, project_id, section_order, title, content, created_at, updated_at FROM sections WHERE project_id = ? ORDER BY section_order",
-            (project_id,)
-        ) as cursor:
-            async for row in cursor:
-                sections.append(SectionResponse(
-                    id=row[0],
-                    project_id=row[1],
-                    section_order=row[2],
-                    title=row[3],
-                    content=row[4],
-                    created_at=row[5],
-                    updated_at=row[6]
-                ))
+    # Get sections, checking ownership in the same query
+    async with db.execute(
+        SQL_LIST_SECTIONS,
+        (project_id, current_user['user_id'])
+    ) as cursor:
+        async for row in cursor:
+            sections.append(SectionResponse(
+                id=row[0],
+                project_id=row[1],
+                section_order=row[2],
+                title=row[3],
+                content=row[4],
+                created_at=row[5],
+                updated_at=row[6]
+            ))
+    
+    if not sections:
+        # Empty result: tell a missing/foreign project apart from one that
+        # has no sections yet
+        await verify_project_owner(db, current_user['user_id'], project_id)
     return sections
 
-@api_router.post("/refine-content")
-async def refine_content(request: RefineContentRequest, current_user: dict = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Get section and verify ownership
-        async with db.execute(
-            """SELECT s.id, s.content, s.title, p.user_id, p.topic 
-               FROM sections s 
-               JOIN projects p ON s.project_id = p.id 
-               WHERE s.id = ?""",
-            (request.section_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail="Section not found")
-            if row[3] != current_user['user_id']:
-                raise HTTPException(status_code=403, detail="Not authorized")
-            
-            section_id, current_content, section_title, _, topic = row
+@api_router.post("/refine-content", response_model=RefineContentResponse)
+async def refine_content(request: RefineContentRequest, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    # Get section and verify ownership
+    async with db.execute(
+        SQL_GET_SECTION_FOR_REFINE,
+        (request.section_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Section not found")
+        if row[3] != current_user['user_id']:
+            raise HTTPException(status_code=403, detail="Not authorized")
         
-        # Generate refined content
-        prompt = f"""You are refining content for a section.
+        section_id, current_content, section_title, _, topic = row
+    
+    # Generate refined content
+    prompt = f"""You are refining content for a section.
 
 Section Title: {section_title}
 Document Topic: {topic}
@@ -521,160 +847,205 @@ User Request: {request.prompt}
 
 Provide the refined version of the content based on the user's request. Return only the refined content, no explanations."""
         
-        refined_content = await generate_with_gemini(prompt)
-        
-        # Update section
+    refined_content = await generate_with_gemini(prompt)
+    
+    now = datetime.now(timezone.utc).isoformat()
+    async with db_write_lock:
+        try:
+            # Update section
+            await db.execute(
+                SQL_UPDATE_SECTION_CONTENT,
+                (refined_content, now, section_id)
+            )
+            
+            # Save refinement history
+            refinement_id = str(uuid.uuid4())
+            await db.execute(
+                SQL_INSERT_REFINEMENT,
+                (refinement_id, section_id, request.prompt, zstd_compressor.compress(refined_content.encode('utf-8')), now)
+            )
+            
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    
+    return {
+        "message": "Content refined successfully",
+        "section_id": section_id,
+        "content": refined_content
+    }
+
+# Latest feedback per section, waiting to be written. Rapid like/dislike
+# toggles only overwrite the entry here; a background task writes whatever is
+# pending every FEEDBACK_FLUSH_INTERVAL_SECONDS in a single transaction.
+pending_feedback: Dict[str, FeedbackRequest] = {}
+
+async def flush_feedback(db: aiosqlite.Connection):
+    """Write buffered feedback onto each section's latest refinement"""
+    if not pending_feedback:
+        return
+    
+    # Entries stay visible to readers until their write has committed
+    async with db_write_lock:
+        batch = list(pending_feedback.values())
+        if not batch:
+            return
         now = datetime.now(timezone.utc).isoformat()
-        await db.execute(
-            "UPDATE sections SET content = ?, updated_at = ? WHERE id = ?",
-            (refined_content, now, section_id)
-        )
-        
-        # Save refinement history
-        refinement_id = str(uuid.uuid4())
-        await db.execute(
-            """INSERT INTO refinements (id, section_id, prompt, response, created_at)
-               VALUES (?, ?, ?, ?, ?)""",
-            (refinement_id, section_id, request.prompt, refined_content, now)
-        )
-        
-        await db.commit()
-        
+        try:
+            # Sections with refinement history: update the newest record
+            await db.executemany(
+                SQL_UPDATE_LATEST_FEEDBACK,
+                [(item.feedback, item.comment, item.section_id) for item in batch]
+            )
+            # Sections without any yet: create a feedback-only record
+            await db.executemany(
+                SQL_INSERT_FIRST_FEEDBACK,
+                [(str(uuid.uuid4()), item.feedback, item.comment, now, item.section_id) for item in batch]
+            )
+            await db.commit()
+        except BaseException:
+            # Includes cancellation at shutdown; the batch stays buffered
+            await db.rollback()
+            raise
+        # Drop what was written unless newer feedback has arrived since
+        for item in batch:
+            if pending_feedback.get(item.section_id) is item:
+                del pending_feedback[item.section_id]
+
+async def feedback_flusher(db: aiosqlite.Connection):
+    while True:
+        await asyncio.sleep(FEEDBACK_FLUSH_INTERVAL_SECONDS)
+        try:
+            await flush_feedback(db)
+        except Exception as e:
+            logger.error(f"Feedback flush failed: {str(e)}")
+
+@api_router.post("/feedback", response_model=MessageResponse, status_code=status.HTTP_202_ACCEPTED)
+async def add_feedback(request: FeedbackRequest, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    # Verify section ownership
+    await verify_section_owner(db, current_user['user_id'], request.section_id)
+    
+    # Only the most recent value matters; it is written on the next flush
+    pending_feedback[request.section_id] = request
+    return {"message": "Feedback saved successfully"}
+
+def feedback_state(feedback: Optional[str], comment: Optional[str]) -> Dict[str, Any]:
+    if feedback:
         return {
-            "message": "Content refined successfully",
-            "section_id": section_id,
-            "content": refined_content
+            "feedback": feedback,
+            "comment": comment or "",
+            "liked": feedback == "like",
+            "disliked": feedback == "dislike"
         }
+    return {
+        "feedback": None,
+        "comment": "",
+        "liked": False,
+        "disliked": False
+    }
 
-@api_router.post("/feedback")
-async def add_feedback(request: FeedbackRequest, current_user: dict = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify section ownership
-        async with db.execute(
-            """SELECT s.id FROM sections s 
-               JOIN projects p ON s.project_id = p.id 
-               WHERE s.id = ? AND p.user_id = ?""",
-            (request.section_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Section not found")
-        
-        # Get latest refinement or create new one
-        async with db.execute(
-            "SELECT id FROM refinements WHERE section_id = ? ORDER BY created_at DESC LIMIT 1",
-            (request.section_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            
-            if row:
-                # Update existing refinement
-                await db.execute(
-                    "UPDATE refinements SET feedback = ?, comment = ? WHERE id = ?",
-                    (request.feedback, request.comment, row[0])
-                )
-            else:
-                # Create new refinement record for feedback
-                refinement_id = str(uuid.uuid4())
-                now = datetime.now(timezone.utc).isoformat()
-                await db.execute(
-                    """INSERT INTO refinements (id, section_id, prompt, response, feedback, comment, created_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (refinement_id, request.section_id, 'Initial feedback', '', request.feedback, request.comment, now)
-                )
-            
-            await db.commit()
-            return {"message": "Feedback saved successfully"}
+def revision_entry(prompt: str, response: str, response_zstd: Optional[bytes], created_at: str) -> Dict[str, Any]:
+    if response_zstd is not None:
+        response = zstd_decompressor.decompress(response_zstd).decode('utf-8')
+    return {
+        "prompt": prompt, 
+        "response": response, 
+        "created_at": created_at,
+        "timestamp": created_at
+    }
 
-@api_router.get("/sections/{section_id}/feedback")
-async def get_section_feedback(section_id: str, current_user: dict = Depends(get_current_user)):
+@api_router.get("/sections/{section_id}/feedback", response_model=FeedbackStateResponse)
+async def get_section_feedback(section_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     """Get feedback (like/dislike) state for a specific section"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify section belongs to user's project
-        async with db.execute(
-            """SELECT s.id FROM sections s
-               JOIN projects p ON s.project_id = p.id 
-               WHERE s.id = ? AND p.user_id = ?""",
-            (section_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Section not found")
-        
-        # Get latest feedback from refinements table
-        async with db.execute(
-            "SELECT feedback, comment FROM refinements WHERE section_id = ? AND feedback IS NOT NULL ORDER BY created_at DESC LIMIT 1",
-            (section_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-            
-        if row and row[0]:
-            return {
-                "feedback": row[0],
-                "comment": row[1] or "",
-                "liked": row[0] == "like",
-                "disliked": row[0] == "dislike"
-            }
-        else:
-            return {
-                "feedback": None,
-                "comment": "",
-                "liked": False,
-                "disliked": False
-            }
-
-@api_router.get("/sections/{section_id}/comments")
-async def get_section_comments(section_id: str, current_user: dict = Depends(get_current_user)):
+    # Verify section belongs to user's project
+    await verify_section_owner(db, current_user['user_id'], section_id)
+    
+    # Feedback that has not been flushed yet is newer than anything stored
+    pending = pending_feedback.get(section_id)
+    if pending:
+        return feedback_state(pending.feedback, pending.comment)
+    
+    # Get latest feedback from refinements table
+    async with db.execute(
+        SQL_GET_LATEST_FEEDBACK,
+        (section_id,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    
+    return feedback_state(*row) if row else feedback_state(None, None)
+
+@api_router.get("/sections/{section_id}/comments", response_model=List[CommentResponse])
+async def get_section_comments(section_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     """Get all comments for a specific section"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify section belongs to user's project
-        async with db.execute(
-            """SELECT s.id FROM sections s
-               JOIN projects p ON s.project_id = p.id 
-               WHERE s.id = ? AND p.user_id = ?""",
-            (section_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Section not found")
+    # Verify section belongs to user's project
+    await verify_section_owner(db, current_user['user_id'], section_id)
+    
+    # Get all comments from refinements table
+    async with db.execute(
+        SQL_LIST_COMMENTS,
+        (section_id,)
+    ) as cursor:
+        comments = await cursor.fetchall()
         
-        # Get all comments from refinements table
-        async with db.execute(
-            "SELECT comment, created_at FROM refinements WHERE section_id = ? AND comment IS NOT NULL AND comment != '' ORDER BY created_at DESC",
-            (section_id,)
-        ) as cursor:
-            comments = await cursor.fetchall()
-            
-        return [{"comment": row[0], "created_at": row[1]} for row in comments]
+    return [{"comment": row[0], "created_at": row[1]} for row in comments]
 
-@api_router.get("/sections/{section_id}/revisions")
-async def get_section_revisions(section_id: str, current_user: dict = Depends(get_current_user)):
+@api_router.get("/sections/{section_id}/revisions", response_model=List[RevisionResponse])
+async def get_section_revisions(section_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
     """Get all revision history (prompts and responses) for a specific section"""
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Verify section belongs to user's project
-        async with db.execute(
-            """SELECT s.id FROM sections s
-               JOIN projects p ON s.project_id = p.id 
-               WHERE s.id = ? AND p.user_id = ?""",
-            (section_id, current_user['user_id'])
-        ) as cursor:
-            if not await cursor.fetchone():
-                raise HTTPException(status_code=404, detail="Section not found")
+    # Verify section belongs to user's project
+    await verify_section_owner(db, current_user['user_id'], section_id)
+    
+    # Get all refinements (excluding initial feedback records)
+    async with db.execute(
+        SQL_LIST_REVISIONS,
+        (section_id,)
+    ) as cursor:
+        revisions = await cursor.fetchall()
         
-        # Get all refinements (excluding initial feedback records)
-        async with db.execute(
-            "SELECT prompt, response, created_at FROM refinements WHERE section_id = ? AND prompt != 'Initial feedback' ORDER BY created_at DESC",
-            (section_id,)
-        ) as cursor:
-            revisions = await cursor.fetchall()
-            
-        return [
-            {
-                "prompt": row[0], 
-                "response": row[1], 
-                "created_at": row[2],
-                "timestamp": row[2]
-            } for row in revisions
-        ]
+    return [revision_entry(*row) for row in revisions]
+
+@api_router.get("/sections/{section_id}/overview", response_model=SectionOverviewResponse)
+async def get_section_overview(section_id: str, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    """Get feedback, comments and revisions for a section in one round-trip.
 
-@api_router.post("/ai-template", response_model=Dict[str, Any])
+    Same payloads as the /feedback, /comments and /revisions endpoints, read
+    with a single ownership-checked query over the section's refinements.
+    """
+    async with db.execute(
+        SQL_GET_SECTION_REFINEMENTS,
+        (section_id, current_user['user_id'])
+    ) as cursor:
+        rows = await cursor.fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Section not found")
+    
+    # Rows are newest first; a section without refinements yields one row
+    # whose refinement columns are all NULL
+    feedback = None
+    comments = []
+    revisions = []
+    for _, prompt, response, response_zstd, row_feedback, comment, created_at in rows:
+        if created_at is None:
+            continue
+        if feedback is None and row_feedback is not None:
+            feedback = feedback_state(row_feedback, comment)
+        if comment:
+            comments.append({"comment": comment, "created_at": created_at})
+        if prompt != 'Initial feedback':
+            revisions.append(revision_entry(prompt, response, response_zstd, created_at))
+    
+    pending = pending_feedback.get(section_id)
+    if pending:
+        feedback = feedback_state(pending.feedback, pending.comment)
+    
+    return {
+        "feedback": feedback or feedback_state(None, None),
+        "comments": comments,
+        "revisions": revisions
+    }
+
+@api_router.post("/ai-template", response_model=AITemplateResponse)
 async def generate_ai_template(request: AITemplateRequest, current_user: dict = Depends(get_current_user)):
     if request.type == 'docx':
         prompt = f"""Generate a document outline for the following topic: {request.topic}
@@ -687,7 +1058,7 @@ Provide 8-12 slide titles that would make a comprehensive presentation. Include
     
     try:
         response = await generate_with_gemini(prompt)
-        items = [line.strip() for line in response.strip().split('\n') if line.strip()]
+        items = [item for line in response.splitlines() if (item := line.strip())]
         
         return {
             'type': request.type,
@@ -698,114 +1069,226 @@ Provide 8-12 slide titles that would make a comprehensive presentation. Include
         logger.error(f"AI template generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/export/{project_id}")
-async def export_document(project_id: str, current_user: dict = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Get project
-        async with db.execute(
-            "SELECT name, type, topic FROM projects WHERE id = ? AND user_id = ?",
-            (project_id, current_user['user_id'])
-        ) as cursor:
-            project_row = await cursor.fetchone()
-            if not project_row:
-                raise HTTPException(status_code=404, detail="Project not found")
-            
-            project_name, doc_type, topic = project_row
+# WordprocessingML tags used when section paragraphs are built directly
+W_PPR = qn('w:pPr')
+W_PSTYLE = qn('w:pStyle')
+W_VAL = qn('w:val')
+W_R = qn('w:r')
+W_T = qn('w:t')
+W_TAB = qn('w:tab')
+W_BR = qn('w:br')
+XML_SPACE = qn('xml:space')
+DOCX_RUN_SPLIT = re.compile(r'([\t\r\n])')
+
+def docx_paragraph(text: str, style_id: Optional[str] = None):
+    """Build a <w:p> element equivalent to Document.add_paragraph(text, style).
+
+    Skips python-docx's per-call style lookup and run proxy objects; tabs and
+    line breaks become <w:tab/> and <w:br/> exactly as python-docx emits them.
+    """
+    p = OxmlElement('w:p')
+    if style_id:
+        SubElement(SubElement(p, W_PPR), W_PSTYLE).set(W_VAL, style_id)
+    if text:
+        r = SubElement(p, W_R)
+        for piece in DOCX_RUN_SPLIT.split(text):
+            if piece == '\t':
+                SubElement(r, W_TAB)
+            elif piece in ('\r', '\n'):
+                SubElement(r, W_BR)
+            elif piece:
+                t = SubElement(r, W_T)
+                t.text = piece
+                if piece[0].isspace() or piece[-1].isspace():
+                    t.set(XML_SPACE, 'preserve')
+    return p
+
+# DrawingML tags used when slide bullets are built directly; paragraph level
+# 0 is the schema default, so no <a:pPr lvl="0"> is written
+DRAWINGML_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+A_P = DRAWINGML_NS + 'p'
+A_R = DRAWINGML_NS + 'r'
+A_T = DRAWINGML_NS + 't'
+PPTX_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b-\x1f]')
+BULLET_PREFIX = re.compile(r'(?m)^[\s•\-*]+')
+
+# ZIP method for parts written by prs.save(); a ContextVar keeps concurrent
+# exports in separate threads from seeing each other's choice
+PPTX_ZIP_COMPRESSION = ContextVar('pptx_zip_compression', default=zipfile.ZIP_DEFLATED)
+
+@functools.cache
+def load_pptx():
+    """Import python-pptx and read its bundled default deck on first export.
+
+    Workers that never export a .pptx skip the python-pptx import graph; the
+    template bytes are still read only once per process.
+    """
+    import pptx
+    from pptx import Presentation
+    from pptx.opc.serialized import _ZipPkgWriter
+    from pptx.util import Inches
+    
+    # python-pptx always deflates every part; take the method from
+    # PPTX_ZIP_COMPRESSION so build_pptx can choose per call
+    def write_part(self, pack_uri, blob):
+        self._zipf.writestr(pack_uri.membername, blob, compress_type=PPTX_ZIP_COMPRESSION.get())
+    _ZipPkgWriter.write = write_part
+    
+    template_bytes = (Path(pptx.__file__).parent / 'templates' / 'default.pptx').read_bytes()
+    return Presentation, Inches, template_bytes
+
+DOCX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PPTX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# Download names: whitespace and path separators become underscores, and
+# characters that would break the Content-Disposition header are dropped
+FILENAME_TRANSLATION = str.maketrans({
+    ' ': '_', '\t': '_', '\r': '_', '\n': '_', '/': '_', '\\': '_',
+    '"': None, ';': None,
+})
+
+def attachment_headers(filename: str) -> Dict[str, str]:
+    """Content-Disposition for a download, RFC 5987-encoded when not plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+def build_docx(project_name: str, sections: List[Dict[str, Any]]) -> bytes:
+    """Render the project as a .docx file and return its bytes"""
+    doc = Document()
+    
+    # Add title
+    title = doc.add_heading(project_name, 0)
+    title.alignment = 1  # Center
+    
+    # Add sections as raw paragraph elements, ahead of the trailing sectPr
+    heading_style_id = doc.styles['Heading 1'].style_id
+    sect_pr = doc.element.body.get_or_add_sectPr()
+    for section in sections:
+        sect_pr.addprevious(docx_paragraph(section['title'], heading_style_id))
+        sect_pr.addprevious(docx_paragraph(section['content'] or ''))
+    
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def build_pptx(project_name: str, topic: str, sections: List[Dict[str, Any]], compress: bool = True) -> bytes:
+    """Render the project as a .pptx deck and return its bytes.
+
+    With compress=False the parts are stored rather than deflated, trading a
+    larger file for less CPU in prs.save().
+    """
+    Presentation, Inches, template_bytes = load_pptx()
+    prs = Presentation(io.BytesIO(template_bytes))
+    prs.slide_width = Inches(10)
+    prs.slide_height = Inches(7.5)
+    
+    # Title slide
+    title_slide_layout = prs.slide_layouts[0]
+    slide = prs.slides.add_slide(title_slide_layout)
+    title = slide.shapes.title
+    subtitle = slide.placeholders[1]
+    title.text = project_name
+    subtitle.text = topic
+    
+    # Content slides; the layout, add_slide and the per-line helpers are bound
+    # once up front rather than looked up again for every slide and bullet
+    bullet_slide_layout = prs.slide_layouts[1]
+    add_slide = prs.slides.add_slide
+    strip_bullets = BULLET_PREFIX.sub
+    has_control_chars = PPTX_CONTROL_CHARS.search
+    for section in sections:
+        slide = add_slide(bullet_slide_layout)
+        shapes = slide.shapes
         
-        # Get sections
-        sections = []
-        async with db.execute(
-            "SELECT title, content FROM sections WHERE project_id = ? ORDER BY section_order",
-            (project_id,)
-        ) as cursor:
-            async for row in cursor:
-                sections.append({'title': row[0], 'content': row[1]})
+        title_shape = shapes.title
+        body_shape = shapes.placeholders[1]
         
-        if not sections:
-            raise HTTPException(status_code=400, detail="No content to export")
+        title_shape.text = section['title']
         
-        # Generate document
-        if doc_type == 'docx':
-            doc = Document()
-            
-            # Add title
-            title = doc.add_heading(project_name, 0)
-            title.alignment = 1  # Center
-            
-            # Add sections
-            for section in sections:
-                doc.add_heading(section['title'], 1)
-                doc.add_paragraph(section['content'] or '')
-            
-            # Save to temp file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
-            doc.save(temp_file.name)
-            temp_file.close()
-            
-            return FileResponse(
-                temp_file.name,
-                media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                filename=f"{project_name.replace(' ', '_')}.docx"
-            )
+        tf = body_shape.text_frame
+        tx_body = tf._txBody
+        content = section['content'] or ''
         
-        elif doc_type == 'pptx':
-            prs = Presentation()
-            prs.slide_width = Inches(10)
-            prs.slide_height = Inches(7.5)
-            
-            # Title slide
-            title_slide_layout = prs.slide_layouts[0]
-            slide = prs.slides.add_slide(title_slide_layout)
-            title = slide.shapes.title
-            subtitle = slide.placeholders[1]
-            title.text = project_name
-            subtitle.text = topic
-            
-            # Content slides
-            for section in sections:
-                bullet_slide_layout = prs.slide_layouts[1]
-                slide = prs.slides.add_slide(bullet_slide_layout)
-                shapes = slide.shapes
-                
-                title_shape = shapes.title
-                body_shape = shapes.placeholders[1]
-                
-                title_shape.text = section['title']
-                
-                tf = body_shape.text_frame
-                content = section['content'] or ''
-                
-                # Parse content into bullet points
-                lines = [line.strip() for line in content.split('\n') if line.strip()]
-                for line in lines:
-                    # Remove bullet characters if present
-                    clean_line = line.lstrip('•-*').strip()
-                    if clean_line:
-                        p = tf.add_paragraph()
-                        p.text = clean_line
-                        p.level = 0
-            
-            # Save to temp file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pptx')
-            prs.save(temp_file.name)
-            temp_file.close()
-            
-            return FileResponse(
-                temp_file.name,
-                media_type='application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                filename=f"{project_name.replace(' ', '_')}.pptx"
-            )
+        # Parse content into bullet points; one regex pass over the whole
+        # text drops the bullet characters from every line. Split on '\n'
+        # only: splitlines() would also break on vertical tabs, which stay
+        # inside the bullet as <a:br/>; rstrip() removes any CRLF '\r'
+        for line in strip_bullets('', content).split('\n'):
+            clean_line = line.rstrip()
+            if not clean_line:
+                continue
+            if has_control_chars(clean_line):
+                # Let python-pptx handle line breaks and _xHHHH_ escaping
+                tf.add_paragraph().text = clean_line
+                continue
+            p = SubElement(tx_body, A_P)
+            SubElement(SubElement(p, A_R), A_T).text = clean_line
+    
+    buf = io.BytesIO()
+    token = PPTX_ZIP_COMPRESSION.set(zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+    try:
+        prs.save(buf)
+    finally:
+        PPTX_ZIP_COMPRESSION.reset(token)
+    return buf.getvalue()
 
-app.include_router(api_router)
+@api_router.get("/export/{project_id}")
+async def export_document(project_id: str, compress: bool = True, current_user: dict = Depends(get_current_user), db: aiosqlite.Connection = Depends(get_db)):
+    # Get project and its sections (one row with NULL section columns when
+    # nothing has been generated yet)
+    async with db.execute(
+        SQL_GET_EXPORT_ROWS,
+        (project_id, current_user['user_id'])
+    ) as cursor:
+        rows = await cursor.fetchall()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    project_name, doc_type, topic = rows[0][:3]
+    if rows[0][3] is None:
+        raise HTTPException(status_code=400, detail="No content to export")
+    sections = [{'title': row[3], 'content': row[4]} for row in rows]
+    
+    # Build the file in a worker thread so the event loop keeps serving other
+    # requests; the helper also releases the document tree before sending
+    if doc_type == 'docx':
+        return Response(
+            content=await asyncio.to_thread(build_docx, project_name, sections),
+            media_type=DOCX_MEDIA_TYPE,
+            headers=attachment_headers(f"{project_name.translate(FILENAME_TRANSLATION)}.docx")
+        )
+    
+    elif doc_type == 'pptx':
+        return Response(
+            content=await asyncio.to_thread(build_pptx, project_name, topic, sections, compress),
+            media_type=PPTX_MEDIA_TYPE,
+            headers=attachment_headers(f"{project_name.translate(FILENAME_TRANSLATION)}.pptx")
+        )
 
+# Middleware is registered before the routes so the stack is final at startup
 app.add_middleware(
     CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_credentials=CORS_ORIGINS != ('*',),
+    allow_origins=list(CORS_ORIGINS),
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+app.include_router(api_router)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Import string rather than the app object, so uvicorn can spawn workers.
+    # "auto" picks uvloop and httptools when uvicorn[standard] is installed.
+    # Caches and the feedback buffer are per process, so keep the default
+    # of one worker unless WEB_CONCURRENCY says otherwise.
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.environ.get('WEB_CONCURRENCY', '1')),
+    )
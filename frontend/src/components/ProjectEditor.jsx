@@ -37,23 +37,21 @@ const ProjectEditor = () => {
       const sectionsWithData = await Promise.all(
         sectionsRes.data.map(async (section) => {
           try {
-            const [feedbackRes, commentsRes, revisionsRes] = await Promise.all([
-              axios.get(`${API}/sections/${section.id}/feedback`),
-              axios.get(`${API}/sections/${section.id}/comments`),
-              axios.get(`${API}/sections/${section.id}/revisions`)
-            ]);
+            // Feedback, comments and revisions in a single request
+            const overviewRes = await axios.get(`${API}/sections/${section.id}/overview`);
+            const { feedback: sectionFeedback, comments: sectionComments, revisions } = overviewRes.data;
             
             // Set initial feedback and comments state
             const sectionId = section.id;
-            setFeedback(prev => ({...prev, [sectionId]: feedbackRes.data.feedback}));
-            setComments(prev => ({...prev, [sectionId]: feedbackRes.data.comment || ''}));
+            setFeedback(prev => ({...prev, [sectionId]: sectionFeedback.feedback}));
+            setComments(prev => ({...prev, [sectionId]: sectionFeedback.comment || ''}));
             
             return {
               ...section,
-              persistedComments: commentsRes.data || [],
-              revisionHistory: revisionsRes.data || [],
-              liked: feedbackRes.data.liked,
-              disliked: feedbackRes.data.disliked
+              persistedComments: sectionComments || [],
+              revisionHistory: revisions || [],
+              liked: sectionFeedback.liked,
+              disliked: sectionFeedback.disliked
             };
           } catch (error) {
             // Failed to load section data, will use cached version